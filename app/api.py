@@ -1,6 +1,9 @@
 # This file defines the API routes/endpoints.
 
-from fastapi import APIRouter, File, UploadFile
+from typing import List
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 # Import the core logic functions from the services module
 from . import services
@@ -11,26 +14,87 @@ from .schemas import AnalysisResponse, TextRequest
 # Create a new router object. This helps in modularizing the API.
 router = APIRouter()
 
+# Starlette has already spooled the whole multipart body to a temporary file by
+# the time a handler runs, so these limits bound the copies the handler makes in
+# memory (and sends on to the OCR workers), not what the server receives.
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_BATCH_UPLOAD_BYTES = 50 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def _too_large(what: str, limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{what} larger than {limit // (1024 * 1024)} MB.")
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """
+    Reads an uploaded file in chunks, stopping as soon as it exceeds MAX_UPLOAD_BYTES.
+    """
+    chunks = []
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise _too_large(f"{file.filename} is", MAX_UPLOAD_BYTES)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
 @router.post("/detect-from-image", response_model=AnalysisResponse)
 async def detect_from_image(file: UploadFile = File(..., description="An image file (e.g., receipt, invoice).")):
     """
     Processes an image to extract and classify financial amounts.
     """
-    image_bytes = await file.read()
+    image_bytes = await _read_upload(file)
     
     # Step 1: Perform OCR using the service function
-    raw_text = services.extract_text_from_image(image_bytes)
+    raw_text = await services.extract_text_from_image(image_bytes)
     if not raw_text.strip():
         raise HTTPException(status_code=400, detail="OCR could not detect any text in the image.")
     
-    # Step 2: Analyze the extracted text using the service function
-    return services.analyze_text_for_amounts(raw_text)
+    # Step 2: Analyze the extracted text using the service function.
+    # OCR output has no length limit, so keep the analysis off the event loop.
+    return await run_in_threadpool(services.analyze_text_for_amounts, raw_text)
+
+
+@router.post("/detect-from-images", response_model=List[AnalysisResponse])
+async def detect_from_images(files: List[UploadFile] = File(..., description="Several image files (e.g., receipts, invoices).")):
+    """
+    Processes a batch of images and returns one analysis per image.
+    """
+    if len(files) > services.MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {services.MAX_BATCH_IMAGES} images can be sent at once.")
+    images = []
+    total_bytes = 0
+    for file in files:
+        images.append(await _read_upload(file))
+        total_bytes += len(images[-1])
+        if total_bytes > MAX_BATCH_UPLOAD_BYTES:
+            raise _too_large("The images together are", MAX_BATCH_UPLOAD_BYTES)
+
+    # Step 1: Perform OCR on the whole batch
+    raw_texts = await services.extract_text_from_images(images)
+
+    # Step 2: Analyze the text of every image, off the event loop
+    return [await run_in_threadpool(services.analyze_text_for_amounts, raw_text) for raw_text in raw_texts]
 
 
 @router.post("/detect-from-text", response_model=AnalysisResponse)
-async def detect_from_text(request: TextRequest):
+def detect_from_text(request: TextRequest):
     """
     Processes a raw text string to extract and classify financial amounts.
     """
+    # Declared without async so FastAPI runs this CPU-bound work in its threadpool
+    # instead of blocking the event loop.
     # Directly call the core analysis service function
     return services.analyze_text_for_amounts(request.text)
+
+
+@router.post("/detect-from-texts", response_model=List[AnalysisResponse])
+def detect_from_texts(requests: List[TextRequest]):
+    """
+    Processes a batch of raw text strings and returns one analysis per text.
+    """
+    if len(requests) > services.MAX_BATCH_TEXTS:
+        raise HTTPException(status_code=400, detail=f"At most {services.MAX_BATCH_TEXTS} texts can be sent at once.")
+    return [services.analyze_text_for_amounts(request.text) for request in requests]
@@ -1,17 +1,43 @@
 # This is the main entry point of the application.
 
+import os
+from contextlib import asynccontextmanager
+
+# Run each Tesseract process single-threaded. OpenMP parallelism inside one
+# OCR call hurts throughput when several requests are processed at once;
+# request-level concurrency is what should fill the CPU cores instead.
+# This must be set before any OCR code is imported or launched.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+
+from . import services
 
 # Import the router from the api module
 from .api import router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the OCR engines before serving, so the first requests don't pay for it
+    await services.start_ocr()
+    yield
+    services.shutdown_ocr()
+
+
 # Create the FastAPI app instance
 app = FastAPI(
     title="AI-Powered Amount Detection API",
     description="Extracts financial amounts from images and text.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Compress larger responses. Long receipts return many amounts with repeated
+# keys and source snippets, which compress very well.
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 # Include the API router.
 # All routes defined in app/api.py will now be part of the application.
 # We also add a prefix, which is a good practice for versioning.
@@ -13,5 +13,9 @@ class AnalysisResponse(BaseModel):
     amounts: List[Amount] = Field(..., description="A list of all detected amounts.")
     status: str = Field(default="ok", description="The status of the analysis.")
 
+# Longer than any real receipt or invoice. Analysis is a single linear-time regex
+# scan, so this bounds the work (well under a second) and memory one text can cost.
+MAX_TEXT_LENGTH = 100_000
+
 class TextRequest(BaseModel):
-    text: str = Field(..., description="The raw text to be analyzed.", example="Invoice Total: 5000 INR. Paid amount 2000, balance due is 3000.")
+    text: str = Field(..., max_length=MAX_TEXT_LENGTH, description="The raw text to be analyzed.", example="Invoice Total: 5000 INR. Paid amount 2000, balance due is 3000.")
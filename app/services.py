@@ -0,0 +1,362 @@
+# This file contains the core logic: OCR on images and amount analysis on text.
+
+import asyncio
+import hashlib
+import math
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from cachetools import TTLCache, cached
+from fastapi import HTTPException
+from PIL import Image
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from tesserocr import OEM, PSM, PyTessBaseAPI
+
+from .schemas import AnalysisResponse
+
+# Keywords that indicate an amount, mapped to the type we report for them.
+# "amount" on its own does not say what kind of amount it is.
+KEYWORD_TYPES = {
+    "total": "total_bill",
+    "paid": "paid",
+    "due": "due",
+    "balance": "due",
+    "amount": "unknown",
+}
+
+_KEYWORDS = "|".join(KEYWORD_TYPES)
+# A number only starts at the beginning of a digit run. Otherwise every position
+# inside a long run is tried as a start and the scan takes quadratic time.
+_NUMBER = r"(?<![\d,.])[0-9](?:[\d,]*\d)?(?:\.\d+)?"
+
+# A keyword followed by a number a few characters later (e.g. "Total bill: 4500"),
+# or a number directly followed by a keyword (e.g. "4500 total").
+# The second form only applies when no number follows the keyword; otherwise a
+# quantity, date or invoice number in front of "Total: 500" would take the keyword
+# and the real amount would be lost.
+# Compiled once; the whole scan runs inside the C regex engine.
+AMOUNT_RE = re.compile(
+    rf"\b(?P<kw_before>{_KEYWORDS})\b[^0-9\n]{{0,12}}?(?P<num_after>{_NUMBER})"
+    rf"|(?P<num_before>{_NUMBER})[^0-9A-Za-z\n]{{0,8}}\b(?P<kw_after>{_KEYWORDS})\b"
+    rf"(?![^0-9\n]{{0,12}}\d)",
+    re.IGNORECASE,
+)
+KEYWORD_RE = re.compile(rf"\b(?:{_KEYWORDS})\b", re.IGNORECASE)
+
+# Number of OCR worker processes. Each process keeps its own Tesseract API open,
+# so this is also the number of loaded engines. Running OCR in separate processes
+# keeps it off the event loop and the shared threadpool, and uses every core.
+# Every uvicorn worker has its own pool, so by default the cores are shared out
+# between the WEB_CONCURRENCY workers; override with the OCR_CONCURRENCY env variable.
+_WEB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", max(1, (os.cpu_count() or 1) // _WEB_WORKERS)))
+
+# How long starting the OCR pool may take before startup is considered failed.
+OCR_START_TIMEOUT = 120
+
+# Set in each OCR worker process by _init_ocr_worker
+_ocr_api = None
+_ocr_start_barrier = None
+
+
+def _init_ocr_worker(start_barrier) -> None:
+    """
+    Creates the Tesseract API of an OCR worker process when the process starts.
+    Creating the API loads the language data, so it is only done once per process.
+    """
+    global _ocr_api, _ocr_start_barrier
+    _ocr_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+    _ocr_start_barrier = start_barrier
+
+
+def _wait_for_all_workers() -> None:
+    # Blocks this worker until every worker has run its initializer. While one
+    # start-up task waits here, the next one has to go to a new worker.
+    _ocr_start_barrier.wait(timeout=OCR_START_TIMEOUT)
+
+
+# The pool only exists in the server process, between start_ocr() and shutdown_ocr()
+_ocr_executor: Optional[ProcessPoolExecutor] = None
+# Needs Python 3.10+, where asyncio locks bind to the running loop on first use
+_ocr_executor_lock = asyncio.Lock()
+
+
+async def _start_ocr_executor() -> ProcessPoolExecutor:
+    """
+    Creates an OCR pool and waits until every worker has loaded its Tesseract API.
+    """
+    # Worker processes are spawned rather than forked, since the server process
+    # already runs threads by the time OCR starts.
+    context = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(
+        max_workers=OCR_CONCURRENCY,
+        mp_context=context,
+        initializer=_init_ocr_worker,
+        initargs=(context.Barrier(OCR_CONCURRENCY),),
+    )
+    try:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, _wait_for_all_workers) for _ in range(OCR_CONCURRENCY)))
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return executor
+
+
+class _OcrPoolUnavailable(Exception):
+    """
+    The OCR pool could not take the work, e.g. because another request's worker
+    died and broke it. The input itself never ran, so this says nothing about it.
+    """
+
+
+# Failures that say nothing about the image itself. These are retried with
+# exponential backoff, and reported as 503 if they keep happening. A worker dying
+# while running the image (BrokenProcessPool) is handled separately in _run_ocr.
+TRANSIENT_OCR_ERRORS = (_OcrPoolUnavailable, BrokenPipeError)
+
+# Limits how much OCR work a single batch request can queue.
+MAX_BATCH_IMAGES = 32
+
+# Limits how many texts a single batch request can send for analysis.
+MAX_BATCH_TEXTS = 100
+
+# Images whose shortest side is below this are upscaled before OCR, which gets
+# typical phone photos and scans close to the ~300 DPI Tesseract is tuned for.
+MIN_OCR_SIDE = 1000
+# Upscaling never makes the longest side bigger than this, which bounds the memory
+# used by resizing and thresholding.
+MAX_OCR_SIDE = 4000
+# Images this much longer than they are wide cannot be a document page and are
+# rejected before any resizing.
+MAX_ASPECT_RATIO = 20
+
+# Large JPEGs are decoded straight to grayscale at a reduced scale, as long as both
+# sides stay at least this big. libjpeg does the scaling during decoding.
+JPEG_DRAFT_SIZE = (2000, 2000)
+
+# Results are cached by a hash of the input, so retried or duplicate uploads of the
+# same receipt skip OCR and analysis entirely. Entries expire after an hour.
+CACHE_SIZE = 1024
+CACHE_TTL = 3600
+_ocr_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+_analysis_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def _preprocess(image: Image.Image) -> Image.Image:
+    """
+    Converts the image to a clean black-and-white version for OCR.
+    Binarized input makes Tesseract both faster and more accurate.
+    """
+    shortest_side, longest_side = sorted(image.size)
+    if shortest_side == 0 or longest_side / shortest_side > MAX_ASPECT_RATIO:
+        raise ValueError(f"Unsupported image size {image.width}x{image.height}.")
+
+    image = image.convert("L")
+
+    if shortest_side < MIN_OCR_SIDE:
+        scale = min(MIN_OCR_SIDE / shortest_side, MAX_OCR_SIDE / longest_side)
+        if scale > 1:
+            image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    binary = cv2.adaptiveThreshold(
+        np.array(image), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10
+    )
+    return Image.fromarray(binary)
+
+
+def _ocr_image(image_bytes: bytes) -> str:
+    """
+    Runs OCR on one image with the worker process's persistent Tesseract API.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    if image.format == "JPEG":
+        image.draft("L", JPEG_DRAFT_SIZE)
+    image = _preprocess(image)
+    _ocr_api.SetImage(image)
+    return _ocr_api.GetUTF8Text()
+
+
+async def start_ocr() -> None:
+    """
+    Starts the OCR worker processes and waits until each has loaded its Tesseract API.
+    This moves the language data loading from the first requests to startup, and
+    fails fast if Tesseract or its language data is missing.
+    """
+    global _ocr_executor
+    async with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = await _start_ocr_executor()
+
+
+def shutdown_ocr() -> None:
+    """
+    Stops the OCR worker processes.
+    """
+    global _ocr_executor
+    if _ocr_executor is not None:
+        _ocr_executor.shutdown(cancel_futures=True)
+        _ocr_executor = None
+
+
+async def _get_ocr_executor() -> ProcessPoolExecutor:
+    try:
+        await start_ocr()
+    except Exception as e:
+        raise _OcrPoolUnavailable() from e
+    return _ocr_executor
+
+
+async def _replace_ocr_executor(broken: ProcessPoolExecutor) -> None:
+    """
+    Swaps a broken pool for a freshly started one.
+    Concurrent requests may see the same broken pool; only the first replaces it.
+    """
+    global _ocr_executor
+    async with _ocr_executor_lock:
+        if _ocr_executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _ocr_executor = None
+            try:
+                _ocr_executor = await _start_ocr_executor()
+            except Exception as e:
+                raise _OcrPoolUnavailable() from e
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.1, max=1.0),
+    retry=retry_if_exception_type(TRANSIENT_OCR_ERRORS),
+    reraise=True,
+)
+async def _submit_ocr(func, arg):
+    """
+    Runs an OCR function in the worker pool, retrying while the pool is unavailable.
+    Raises BrokenProcessPool if a worker died while the work was running.
+    """
+    executor = await _get_ocr_executor()
+    try:
+        future = executor.submit(func, arg)
+    except BrokenProcessPool as e:
+        # Broken before the work reached it: replace the pool and retry
+        await _replace_ocr_executor(executor)
+        raise _OcrPoolUnavailable() from e
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        await _replace_ocr_executor(executor)
+        raise
+
+
+async def _run_ocr(func, arg):
+    """
+    Runs an OCR function in the worker pool.
+    A dying worker fails every task in flight on the pool, and is often caused by
+    the input itself (a Tesseract crash, running out of memory). Such a failure is
+    retried only once: a request caught up in another input's crash gets a second
+    chance, while an input that keeps killing workers is not run again and again.
+    """
+    try:
+        return await _submit_ocr(func, arg)
+    except BrokenProcessPool:
+        return await _submit_ocr(func, arg)
+
+
+async def extract_text_from_image(image_bytes: bytes) -> str:
+    """
+    Runs Tesseract OCR on the raw image bytes and returns the extracted text.
+    The work runs in an OCR worker process, so the event loop is never blocked.
+    """
+    key = _digest(image_bytes)
+    cached_text = _ocr_cache.get(key)
+    if cached_text is not None:
+        return cached_text
+
+    try:
+        text = await _run_ocr(_ocr_image, image_bytes)
+    except TRANSIENT_OCR_ERRORS:
+        raise HTTPException(status_code=503, detail="OCR is temporarily unavailable, please try again.")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=400, detail="OCR crashed while processing the image.")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not process the image: {e}")
+
+    _ocr_cache[key] = text
+    return text
+
+
+async def extract_text_from_images(images: List[bytes]) -> List[str]:
+    """
+    Runs Tesseract OCR on several images and returns one text per image.
+    Only images not found in the cache are processed. Each runs as its own task,
+    so the batch is spread over all OCR workers, and an image that crashes a
+    worker does not force the rest of the batch to run again.
+    """
+    keys = [_digest(image_bytes) for image_bytes in images]
+    texts = [_ocr_cache.get(key) for key in keys]
+
+    async def ocr_missing(i: int) -> None:
+        texts[i] = await _run_ocr(_ocr_image, images[i])
+        _ocr_cache[keys[i]] = texts[i]
+
+    try:
+        await asyncio.gather(*(ocr_missing(i) for i, text in enumerate(texts) if text is None))
+    except TRANSIENT_OCR_ERRORS:
+        raise HTTPException(status_code=503, detail="OCR is temporarily unavailable, please try again.")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=400, detail="OCR crashed while processing the images.")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not process the images: {e}")
+
+    return texts
+
+
+def _classify(source_text: str) -> str:
+    """
+    Returns the amount type for the first specific keyword found in the snippet.
+    """
+    for keyword in KEYWORD_RE.findall(source_text):
+        amount_type = KEYWORD_TYPES[keyword.lower()]
+        if amount_type != "unknown":
+            return amount_type
+    return "unknown"
+
+
+def analyze_text_for_amounts(text: str) -> AnalysisResponse:
+    """
+    Finds keywords such as 'total', 'paid' or 'due' near numbers in the text
+    and returns the classified amounts.
+    """
+    # Hand out a copy so callers never share the cached instance
+    return _analyze_cached(text).model_copy(deep=True)
+
+
+@cached(_analysis_cache, key=lambda text: _digest(text.encode()), lock=threading.Lock())
+def _analyze_cached(text: str) -> AnalysisResponse:
+    # finditer never returns overlapping matches, so every match has its own
+    # (start, end) offsets and there are no duplicate spans to filter out.
+    found_amounts = []
+    for match in AMOUNT_RE.finditer(text):
+        source_text = match.group(0).strip()
+        number = match.group("num_after") or match.group("num_before")
+        value = float(number.replace(",", ""))
+        # Absurdly long digit runs overflow to inf, which is not a valid JSON number
+        if not math.isfinite(value):
+            continue
+
+        # Build plain rows and validate them in a single pass instead of one model per row
+        found_amounts.append({"type": _classify(source_text), "value": value, "source_text": source_text})
+
+    return AnalysisResponse.model_validate({"amounts": found_amounts})
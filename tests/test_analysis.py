@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from app.services import analyze_text_for_amounts
+
+
+def _amounts(text):
+    return [(a.type, a.value) for a in analyze_text_for_amounts(text).amounts]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (
+            "Your total bill is 4500.00 INR. Amount paid: 2000. The amount due is now 2500.",
+            [("total_bill", 4500.0), ("paid", 2000.0), ("due", 2500.0)],
+        ),
+        (
+            "Invoice Total: 5000 INR. Paid amount 2000, balance due is 3000.",
+            [("total_bill", 5000.0), ("paid", 2000.0), ("due", 3000.0)],
+        ),
+        ("Total: 2500\nPaid - 1000\nDue = 1500", [("total_bill", 2500.0), ("paid", 1000.0), ("due", 1500.0)]),
+    ],
+)
+def test_readme_examples(text, expected):
+    assert _amounts(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # A number in front of a keyword must not take it when the amount follows
+        ("Qty 2 Total 500", [("total_bill", 500.0)]),
+        ("Date: 12/03/2024 Total: 500", [("total_bill", 500.0)]),
+        ("Invoice No. 12345 Total Amount: 5000", [("total_bill", 5000.0)]),
+    ],
+)
+def test_number_before_keyword_does_not_steal_the_amount(text, expected):
+    assert _amounts(text) == expected
+
+
+def test_number_followed_by_keyword():
+    assert _amounts("Rs 1,234.50 total") == [("total_bill", 1234.5)]
+
+
+def test_no_amounts():
+    assert analyze_text_for_amounts("Thank you for visiting").amounts == []
+
+
+def test_cached_result_is_not_shared():
+    text = "Total: 750"
+    first = analyze_text_for_amounts(text)
+    first.amounts[0].value = 0
+    first.amounts.clear()
+    assert _amounts(text) == [("total_bill", 750.0)]
+
+
+@pytest.mark.parametrize("text", ["9" * 100_000, "1," * 50_000, "1." * 50_000, "9 " * 50_000 + "total"])
+def test_long_digit_runs_scan_in_linear_time(text):
+    start = time.perf_counter()
+    analyze_text_for_amounts(text)
+    assert time.perf_counter() - start < 1
+
+
+def test_overflowing_number_is_dropped():
+    assert _amounts("Total: " + "9" * 400 + " Paid: 100") == [("paid", 100.0)]
@@ -0,0 +1,112 @@
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi import HTTPException
+
+from app import services
+
+
+class WorkerDied(Exception):
+    pass
+
+
+class FakeExecutor:
+    """
+    Runs work inline. Work raising WorkerDied breaks the pool like a crashed
+    worker process does: the future fails and later submissions are rejected.
+    """
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, func, *args):
+        if self.broken:
+            raise BrokenProcessPool("pool is broken")
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except WorkerDied:
+            self.broken = True
+            future.set_exception(BrokenProcessPool("a worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def _fake_ocr(image_bytes):
+    if image_bytes == b"crash":
+        raise WorkerDied()
+    if image_bytes == b"invalid":
+        raise ValueError("cannot identify image file")
+    return image_bytes.decode()
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """
+    Replaces the process pool with FakeExecutors and returns every pool started.
+    """
+    started = []
+
+    async def start_executor():
+        started.append(FakeExecutor())
+        return started[-1]
+
+    monkeypatch.setattr(services, "_start_ocr_executor", start_executor)
+    monkeypatch.setattr(services, "_ocr_image", _fake_ocr)
+    monkeypatch.setattr(services, "_ocr_executor", None)
+    services._ocr_cache.clear()
+    return started
+
+
+def _extract(image_bytes):
+    return asyncio.run(services.extract_text_from_image(image_bytes))
+
+
+def test_ocr_text_is_returned(pools):
+    assert _extract(b"Total: 500") == "Total: 500"
+    assert len(pools) == 1
+
+
+def test_invalid_image_is_rejected_without_retry(pools):
+    with pytest.raises(HTTPException) as exc_info:
+        _extract(b"invalid")
+    assert exc_info.value.status_code == 400
+    assert len(pools) == 1
+
+
+def test_pool_broken_by_another_request_is_replaced_and_retried(pools):
+    asyncio.run(services.start_ocr())
+    pools[0].broken = True
+
+    assert _extract(b"Total: 500") == "Total: 500"
+    assert len(pools) == 2
+    assert pools[0].shut_down
+    assert services._ocr_executor is pools[1]
+
+
+def test_image_that_kills_the_worker_is_retried_once(pools):
+    with pytest.raises(HTTPException) as exc_info:
+        _extract(b"crash")
+    assert exc_info.value.status_code == 400
+    # The initial pool plus one replacement per crash, but no third attempt
+    assert len(pools) == 3
+
+
+def test_unavailable_pool_is_reported_as_503(pools, monkeypatch):
+    async def failing_start():
+        raise RuntimeError("tesseract is not installed")
+
+    monkeypatch.setattr(services, "_start_ocr_executor", failing_start)
+    with pytest.raises(HTTPException) as exc_info:
+        _extract(b"Total: 500")
+    assert exc_info.value.status_code == 503
+
+
+def test_batch_images_run_as_separate_tasks(pools):
+    texts = asyncio.run(services.extract_text_from_images([b"Total: 1", b"Total: 2", b"Total: 1"]))
+    assert texts == ["Total: 1", "Total: 2", "Total: 1"]
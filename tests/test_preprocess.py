@@ -0,0 +1,21 @@
+import pytest
+from PIL import Image
+
+from app.services import MAX_OCR_SIDE, MIN_OCR_SIDE, _preprocess
+
+
+def test_small_image_is_upscaled_to_min_side():
+    image = _preprocess(Image.new("RGB", (200, 400), "white"))
+    assert image.mode == "L"
+    assert image.size == (MIN_OCR_SIDE, 2 * MIN_OCR_SIDE)
+
+
+def test_upscale_is_capped_by_max_side():
+    image = _preprocess(Image.new("RGB", (100, 1000), "white"))
+    assert max(image.size) == MAX_OCR_SIDE
+
+
+@pytest.mark.parametrize("size", [(1, 5000), (5000, 1), (100, 3000)])
+def test_extreme_aspect_ratio_is_rejected(size):
+    with pytest.raises(ValueError):
+        _preprocess(Image.new("L", size))